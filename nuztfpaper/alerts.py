@@ -1,33 +1,23 @@
+import logging
 import os
 
 import numpy as np
 import pandas as pd
 
+from nuztfpaper.ingest import (followed_up_columns, followed_up_key,
+                               incomplete_followed_up, load_archive, parse_bool)
 from nuztfpaper.latency import get_latency
+from nuztfpaper.profiling import count_bytes_read, span
+from nuztfpaper.schema import (alert_categories, categorise, clean_strings,
+                               downcast_numeric, non_columns, normalise,
+                               obs_columns, validate)
 from nuztfpaper.style import data_dir
 
-base_file = os.path.join(data_dir, "neutrino_too_followup.xlsx")
-
-obs = pd.read_excel(base_file, sheet_name="OVERVIEW_FU", skiprows=[0, 1, 2])
+logger = logging.getLogger(__name__)
 
-obs = obs[~np.isnan(obs["RA"])]
+base_file = os.path.join(data_dir, "neutrino_too_followup.xlsx")
 
 latency_key = "Latency (hours)"
-latencies = []
-
-for index, row in obs.iterrows():
-    name = row["Event"]
-    res = get_latency(name)
-    if res is not None:
-        latencies.append(get_latency(name).value)
-    else:
-        latencies.append(np.nan)
-
-obs[latency_key] = latencies
-
-non = pd.read_excel(
-    base_file, sheet_name="OVERVIEW_NOT_FU", skiprows=[0, 1], usecols=range(11)
-)
 
 relabels = {
     "Alert retraction": "Alert Retraction",
@@ -36,10 +26,136 @@ relabels = {
     "Poor Signalness and Localization": "Poor Signalness and Localisation",
 }
 
-for key, new in relabels.items():
-    mask = non["Rejection reason"] == key
-    non["Rejection reason"][mask] = new
 
-tot_nu_area = np.sum(obs["Observed area (corrected for chip gaps)"])
+def load_obs() -> pd.DataFrame:
+    obs = pd.read_excel(base_file, sheet_name="OVERVIEW_FU", skiprows=[0, 1, 2])
+
+    obs = obs[~np.isnan(obs["RA"])]
+
+    latencies = []
+
+    for index, row in obs.iterrows():
+        name = row["Event"]
+        res = get_latency(name)
+        if res is not None:
+            latencies.append(get_latency(name).value)
+        else:
+            latencies.append(np.nan)
+
+    obs[latency_key] = latencies
 
+    return normalise(obs, obs_columns, alert_categories, name="obs")
+
+
+def load_non() -> pd.DataFrame:
+    non = pd.read_excel(
+        base_file, sheet_name="OVERVIEW_NOT_FU", skiprows=[0, 1], usecols=range(11)
+    )
+
+    for key, new in relabels.items():
+        mask = non["Rejection reason"] == key
+        non.loc[mask, "Rejection reason"] = new
+
+    return normalise(non, non_columns, alert_categories, name="non")
+
+
+with span("alerts.load"):
+    count_bytes_read(base_file)
+    obs = load_obs()
+    non = load_non()
+
+tot_nu_area = np.sum(
+    obs["Observed area (corrected for chip gaps)"].to_numpy(dtype=np.float64)
+)
+
+# Categoricals are only preserved by concat if both tables share them
 joint = pd.concat([non, obs], axis=0).sort_values(by=["Event"])
+joint = categorise(joint, alert_categories)
+
+rejection_counts = non["Rejection reason"].value_counts()
+
+
+def _append(table: pd.DataFrame, new: pd.DataFrame) -> pd.DataFrame:
+    # New rows continue the existing integer index, so positional lookups
+    # like non["Event"][i] keep working
+    new.index = range(table.index.max() + 1, table.index.max() + 1 + len(new))
+    new = new[[x for x in new.columns if x in table.columns]].copy()
+
+    # Archived columns which are entirely missing are read as floats
+    for col in new.columns:
+        if pd.api.types.is_string_dtype(table[col].dtype):
+            new[col] = new[col].astype(table[col].dtype)
+
+    table = pd.concat([table, new])
+    # Concatenation widens numeric columns (e.g. int8 with missing values becomes
+    # float64), so downcast again to keep the table schema
+    return categorise(downcast_numeric(table), alert_categories)
+
+
+def add_alerts(new: pd.DataFrame):
+    """
+    Incrementally add archived alerts to obs, non and joint, and update the
+    latency, area and rejection-reason totals, without rereading the workbook.
+    Alerts which are already present are ignored, and followed-up alerts
+    missing fields needed for obs are skipped with an error.
+
+    The module-level tables are replaced by new dataframes rather than modified,
+    so names bound earlier (e.g. by `from nuztfpaper.alerts import obs`) keep
+    the old tables. Reread them as `nuztfpaper.alerts.obs` etc. afterwards.
+
+    :param new: Dataframe of alerts in the archive schema
+    :return: None
+    """
+    global obs, non, joint, tot_nu_area, rejection_counts
+
+    new = new[~new["Event"].isin(joint["Event"])]
+
+    incomplete = incomplete_followed_up(new)
+    if incomplete.any():
+        logger.error(
+            f"Skipping followed-up alerts {list(new[incomplete]['Event'])}, "
+            f"which are missing some of {followed_up_columns}"
+        )
+        new = new[~incomplete]
+
+    if len(new) == 0:
+        return
+
+    new = downcast_numeric(clean_strings(new.copy()))
+    new["Rejection reason"] = new["Rejection reason"].replace(relabels)
+
+    mask = new[followed_up_key].map(parse_bool).astype(bool)
+
+    new_obs = new[mask].copy()
+    new_non = new[~mask].copy()
+
+    if len(new_obs) > 0:
+        new_obs[latency_key] = [
+            np.nan if (res := get_latency(x)) is None else res.value
+            for x in new_obs["Event"]
+        ]
+        obs = _append(obs, new_obs)
+        validate(obs, obs_columns, alert_categories, name="obs")
+
+        tot_nu_area += np.sum(
+            new_obs["Observed area (corrected for chip gaps)"].to_numpy(
+                dtype=np.float64
+            )
+        )
+
+    if len(new_non) > 0:
+        non = _append(non, new_non)
+        validate(non, non_columns, alert_categories, name="non")
+
+        rejection_counts = rejection_counts.add(
+            new_non["Rejection reason"].value_counts(), fill_value=0
+        ).astype(int)
+
+    new_rows = pd.concat([new_obs, new_non], axis=0)
+    new_rows = new_rows[[x for x in new_rows.columns if x in joint.columns]]
+    joint = pd.concat([joint, new_rows], axis=0).sort_values(by=["Event"])
+    joint = categorise(joint, alert_categories)
+
+
+with span("alerts.archive"):
+    add_alerts(load_archive())
@@ -0,0 +1,335 @@
+import glob
+import json
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+
+from nuztfpaper.style import (data_dir, output_folder, output_folder_env_var,
+                              plot_dir, plot_dir_env_var)
+
+logger = logging.getLogger(__name__)
+
+package_dir = os.path.dirname(os.path.realpath(__file__))
+base_dir = os.path.dirname(package_dir)
+notebook_dir = os.path.join(base_dir, "notebooks")
+
+stamp_dir_name = ".build"
+
+
+@dataclass
+class Job:
+    name: str
+    notebook: str
+    outputs: list = field(default_factory=list)
+    inputs: list = field(default_factory=list)
+    depends: list = field(default_factory=list)
+
+    @property
+    def notebook_path(self) -> str:
+        return os.path.join(notebook_dir, self.notebook)
+
+
+# Notebooks importing the unpublished `thesis` module (ZTF19aatubsj, at2019fdr,
+# tywin) cannot run from this repository, bzqJ0253+0006 publishes to a personal
+# web directory, and ztf_too_parse/ztf_nu_stats are superseded by the stats_*
+# notebooks, so none of these are part of the build.
+jobs = [
+    Job(
+        "stats_alerts",
+        "stats_alerts.ipynb",
+        outputs=["pie.pdf", "alert_hist.pdf", "alert_cdf.pdf", "ztf_cdf.pdf"],
+        inputs=["neutrino_too_followup.xlsx"],
+    ),
+    Job(
+        "stats_candidates",
+        "stats_candidates.ipynb",
+        outputs=[
+            "candidates.pdf",
+            "transient_pie.pdf",
+            "completeness.pdf",
+            "completeness_range.pdf",
+        ],
+        inputs=["neutrino_too_followup.xlsx"],
+    ),
+    Job(
+        "set_limits",
+        "set_limits.ipynb",
+        outputs=[
+            "limit_app_mag.pdf",
+            "neutrino_CDF.pdf",
+            "limit_abs_mag.pdf",
+            "limit_future.pdf",
+        ],
+        inputs=["neutrino_too_followup.xlsx"],
+    ),
+    # Overwrites figures from set_limits, so must never run at the same time
+    Job(
+        "set_limits_step",
+        "set_limits_step.ipynb",
+        outputs=["p_det.pdf", "p_no_det.pdf", "limit_ztf_future.pdf"],
+        inputs=["neutrino_too_followup.xlsx"],
+        depends=["set_limits"],
+    ),
+    Job(
+        "sn2019pqh",
+        "sn2019pqh.ipynb",
+        outputs=["sn2019pqh_spectrum.pdf", "sn2019pqh_lightcurve.pdf"],
+        inputs=["ZTF19abxtupj_20190928_Keck1_v1.ascii", "ztf19abxtupl.csv"],
+    ),
+    Job(
+        "sn2020lam",
+        "sn2020lam.ipynb",
+        outputs=["sn2020lam_spectrum.pdf", "sn2020lam_lightcurve.pdf"],
+        inputs=["ZTF20abbpkpa_20200606_NOT_v1.ascii", "ZTF20abbpkpa.csv"],
+    ),
+    Job(
+        "sn2020lls",
+        "sn2020lls.ipynb",
+        outputs=["sn2020lls_spectrum.pdf"],
+        inputs=["ZTF20abdnpdo_20200612_NOT_v1.ascii"],
+    ),
+    # Uses the cut spectrum written by sn2019pqh
+    Job(
+        "plot_spectra",
+        "plot_spectra.ipynb",
+        inputs=[
+            "ZTF20abbpkpa_20200606_NOT_v1.ascii",
+            "2005cs_2005-07-02_00-00-00_Ekar_AFOSC_None.dat",
+            "ztf19abxtupj_cut.txt",
+            "1993J_1993-04-15_22-30-00_Ekar_BC-Ekar_SUSPECT.dat",
+            "spec-0391-51782-0220.fits",
+            "ZTF20abdnpdo_20200612_NOT_v1.ascii",
+            "2004aw_2004-04-07_00-00-00_TNG_DOLORES_SUSPECT.dat",
+        ],
+        depends=["sn2019pqh"],
+    ),
+    Job(
+        "bzbJ0955+3551",
+        "bzbJ0955+3551.ipynb",
+        outputs=["bzb_lightcurve_flux.pdf"],
+        inputs=["bzb.fits"],
+    ),
+    Job(
+        "pks1502+106",
+        "pks1502+106.ipynb",
+        outputs=["pks1502_lightcurve_flux.pdf"],
+        inputs=["lc.fits"],
+    ),
+    Job(
+        "irsa_lightcurve",
+        "irsa_lightcurve.ipynb",
+        inputs=["neutrino_too_followup.xlsx"],
+    ),
+]
+
+job_map = {job.name: job for job in jobs}
+
+
+def check_dag(selected: list) -> list:
+    """
+    Check that all dependencies of the selected jobs exist and contain no cycles
+
+    :param selected: Names of jobs
+    :return: Names of jobs in a valid execution order
+    """
+    order = []
+    state = {}
+
+    def visit(name, chain):
+        if name not in job_map:
+            raise KeyError(f"Unknown job '{name}' (required by {chain})")
+        if state.get(name) == "done":
+            return
+        if state.get(name) == "visiting":
+            raise ValueError(f"Cyclic job dependency: {chain + [name]}")
+        state[name] = "visiting"
+        for dep in job_map[name].depends:
+            visit(dep, chain + [name])
+        state[name] = "done"
+        order.append(name)
+
+    for name in selected:
+        visit(name, [])
+
+    return order
+
+
+def stamp_path(job: Job, plot_folder: str) -> str:
+    return os.path.join(plot_folder, stamp_dir_name, f"{job.name}.stamp")
+
+
+def get_input_mtime(job: Job, plot_folder: str) -> float:
+    """
+    Latest modification time of anything the job depends on: the notebook, the
+    package source, the data files it reads and the builds of its dependencies
+
+    :param job: Job
+    :param plot_folder: Plot directory containing build stamps
+    :return: Latest modification time
+    """
+    paths = [job.notebook_path]
+    paths += glob.glob(os.path.join(package_dir, "*.py"))
+    paths += [os.path.join(data_dir, x) for x in job.inputs]
+    paths += [stamp_path(job_map[x], plot_folder) for x in job.depends]
+
+    return max(os.path.getmtime(x) for x in paths if os.path.exists(x))
+
+
+def write_stamp(job: Job, plot_folder: str, output_dir: str):
+    with open(stamp_path(job, plot_folder), "w") as f:
+        json.dump({"time": time.time(), "output_dir": os.path.realpath(output_dir)}, f)
+
+
+def read_stamp(job: Job, plot_folder: str):
+    try:
+        with open(stamp_path(job, plot_folder), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_up_to_date(job: Job, plot_folder: str, output_dir: str = output_folder) -> bool:
+    """
+    A job is up to date if it has a build stamp newer than all its inputs,
+    which was built for the same paper figure directory, and all its declared
+    outputs still exist in both the plot and paper figure directories
+
+    :param job: Job
+    :param plot_folder: Plot directory
+    :param output_dir: Directory for paper figures
+    :return: Boolean
+    """
+    stamp = stamp_path(job, plot_folder)
+
+    # Stamps from older builds do not record the output directory
+    contents = read_stamp(job, plot_folder)
+    if not isinstance(contents, dict):
+        return False
+
+    if contents.get("output_dir") != os.path.realpath(output_dir):
+        return False
+
+    for folder in [plot_folder, output_dir]:
+        for output in job.outputs:
+            if not os.path.isfile(os.path.join(folder, output)):
+                return False
+
+    return os.path.getmtime(stamp) >= get_input_mtime(job, plot_folder)
+
+
+def run_job(job: Job, timeout: int = None) -> float:
+    """
+    Execute a notebook headlessly. Output paths are passed to the kernel
+    through environment variables, which must be set before calling.
+
+    :param job: Job
+    :param timeout: Timeout per cell in seconds
+    :return: Wall time in seconds
+    """
+    import nbformat
+    from nbclient import NotebookClient
+
+    start = time.perf_counter()
+
+    nb = nbformat.read(job.notebook_path, as_version=4)
+
+    # Notebooks read data relative to the repository root
+    client = NotebookClient(
+        nb,
+        timeout=timeout,
+        kernel_name="python3",
+        resources={"metadata": {"path": base_dir}},
+    )
+    client.execute()
+
+    return time.perf_counter() - start
+
+
+def set_build_env(plot_folder: str, output_dir: str):
+    os.environ[plot_dir_env_var] = plot_folder
+    os.environ[output_folder_env_var] = output_dir
+    os.environ["MPLBACKEND"] = "Agg"
+
+    # Older notebooks use `from style import ...`
+    python_path = [package_dir]
+    if "PYTHONPATH" in os.environ:
+        python_path.append(os.environ["PYTHONPATH"])
+    os.environ["PYTHONPATH"] = os.pathsep.join(python_path)
+
+
+def build(
+    selected: list = None,
+    n_workers: int = None,
+    force: bool = False,
+    plot_folder: str = plot_dir,
+    output_dir: str = output_folder,
+    timeout: int = None,
+) -> dict:
+    """
+    Run figure and table jobs in dependency order, running independent jobs in
+    parallel worker processes and skipping jobs which are up to date
+
+    :param selected: Names of jobs to run (with their dependencies), default all
+    :param n_workers: Number of worker processes, default one per CPU
+    :param force: Rerun jobs even if they are up to date
+    :param plot_folder: Directory for plots
+    :param output_dir: Directory for paper figures
+    :param timeout: Timeout per notebook cell in seconds
+    :return: Dictionary mapping job name to status
+    """
+    if selected is None:
+        selected = [x.name for x in jobs]
+
+    order = check_dag(selected)
+
+    for folder in [plot_folder, output_dir, os.path.join(plot_folder, stamp_dir_name)]:
+        os.makedirs(folder, exist_ok=True)
+
+    set_build_env(plot_folder, output_dir)
+
+    status = {}
+    pending = list(order)
+    running = {}
+
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        while len(pending) + len(running) > 0:
+
+            for name in list(pending):
+                job = job_map[name]
+                dep_status = [status.get(x) for x in job.depends]
+
+                if any(x in ["failed", "skipped"] for x in dep_status):
+                    logger.warning(f"Skipping {name}, a dependency did not build")
+                    status[name] = "skipped"
+                    pending.remove(name)
+
+                elif all(x in ["built", "up to date"] for x in dep_status):
+                    pending.remove(name)
+
+                    if not force and is_up_to_date(job, plot_folder, output_dir):
+                        logger.info(f"{name} is up to date")
+                        status[name] = "up to date"
+                    else:
+                        logger.info(f"Running {name}")
+                        running[executor.submit(run_job, job, timeout)] = name
+
+            if len(running) == 0:
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                name = running.pop(future)
+                try:
+                    wall_time = future.result()
+                except Exception as e:
+                    logger.error(f"{name} failed: {e}")
+                    status[name] = "failed"
+                else:
+                    logger.info(f"Built {name} in {wall_time:.1f} s")
+                    write_stamp(job_map[name], plot_folder, output_dir)
+                    status[name] = "built"
+
+    return status
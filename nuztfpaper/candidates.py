@@ -1,93 +1,120 @@
+import logging
+
 import numpy as np
 import pandas as pd
 
 from nuztfpaper.alerts import base_file, obs
+from nuztfpaper.profiling import count, count_bytes_read, span
+from nuztfpaper.schema import (candidate_categories, candidate_columns,
+                               clean_strings, normalise)
+
+logger = logging.getLogger(__name__)
+
+
+def build_candidates(events: pd.DataFrame) -> pd.DataFrame:
+    sheets = []
+
+    maxb = []
+    maxr = []
+    base_class = []
+    sub_class = []
+
+    workbook = pd.ExcelFile(base_file)
+
+    for index, row in events.iterrows():
+        name = row["Event"]
+
+        # Archived alerts have no candidate sheet in the workbook
+        if name not in workbook.sheet_names:
+            logger.debug(f"No candidate sheet for {name}, skipping")
+            continue
+
+        new = pd.read_excel(workbook, sheet_name=name, skiprows=range(6), header=0)
+        count("candidates.sheets_read")
+        if len(new) > 0:
+
+            # Strip stray newlines (e.g. "AGN\n") before classifying
+            new = clean_strings(new)
+            new["neutrino"] = name
 
-candidates = None
+            sheets.append(new)
 
-maxb = []
-maxr = []
-base_class = []
-sub_class = []
+            for _, crow in new.iterrows():
 
-for index, row in obs.iterrows():
-    name = row["Event"]
+                maxb.append(float(crow["max brightness"].split(" ")[0]))
 
-    new = pd.read_excel(base_file, sheet_name=name, skiprows=range(6), header=0)
-    if len(new) > 0:
+                if isinstance(crow["max range"], str):
+                    r = float(crow["max range"].split(" ")[0])
+                else:
+                    r = 0.0
 
-        new["neutrino"] = name
+                maxr.append(r)
 
-        if candidates is None:
-            candidates = new
-        else:
-            candidates = candidates.append(new, ignore_index=True)
+                if crow["Classification"] in ["AGN?", "AGN", "AGN Flare"]:
+                    base_class.append("AGN Flare")
+                    sub_class.append("AGN Flare")
 
-        for _, crow in new.iterrows():
+                elif crow["Classification"] in [
+                    "AGN Variability",
+                    "AGN Variability?",
+                ]:
+                    base_class.append("AGN")
+                    sub_class.append("AGN Variability")
 
-            maxb.append(float(crow["max brightness"].split(" ")[0]))
+                elif crow["Classification"] in ["AGN Variability (FP)"]:
+                    base_class.append("AGN")
+                    sub_class.append("AGN Variability")
 
-            if isinstance(crow["max range"], str):
-                r = float(crow["max range"].split(" ")[0])
-            else:
-                r = 0.0
+                elif str(crow["Classification"]) in ["CV", "Star?", "CV???", "Star"]:
+                    base_class.append("Star")
+                    sub_class.append("Star")
 
-            maxr.append(r)
+                elif crow["Classification"] in ["???", np.nan, "?"]:
+                    base_class.append("Unclassified")
+                    sub_class.append("Unclassified")
 
-            if crow["Classification"] in ["AGN\n", "AGN?", "AGN", "AGN Flare"]:
-                base_class.append("AGN Flare")
-                sub_class.append("AGN Flare")
+                # MNRAS: British English!
+                elif crow["Classification"] in ["artifact?", "Artifact"]:
+                    base_class.append("Artefact")
+                    sub_class.append("Artefact")
 
-            elif crow["Classification"] in [
-                "AGN Variability",
-                "AGN Variability?",
-            ]:
-                base_class.append("AGN")
-                sub_class.append("AGN Variability")
+                elif "Ia" in crow["Classification"]:
+                    base_class.append("Transient")
+                    sub_class.append("SN Ia")
 
-            elif crow["Classification"] in [
-                "AGN Variability (FP)",
-                "AGN Variability (FP)\n",
-            ]:
-                base_class.append("AGN")
-                sub_class.append("AGN Variability")
+                elif "SN" in crow["Classification"]:
+                    base_class.append("Transient")
+                    sub_class.append(crow["Classification"])
 
-            elif str(crow["Classification"]) in ["CV", "Star?", "CV???", "Star"]:
-                base_class.append("Star")
-                sub_class.append("Star")
+                elif crow["Classification"] in ["II/IIb"]:
+                    base_class.append("Transient")
+                    sub_class.append("SN II/IIb")
 
-            elif crow["Classification"] in ["???", np.nan, "?", "???\n\n"]:
-                base_class.append("Unclassified")
-                sub_class.append("Unclassified")
+                elif crow["Classification"] in ["TDE", "Dwarf Nova"]:
+                    base_class.append("Transient")
+                    sub_class.append(crow["Classification"])
 
-            # MNRAS: British English!
-            elif crow["Classification"] in ["artifact?", "Artifact\n", "Artifact"]:
-                base_class.append("Artefact")
-                sub_class.append("Artefact")
+                else:
+                    base_class.append(crow["Classification"])
+                    sub_class.append(crow["Classification"])
 
-            elif "Ia" in crow["Classification"]:
-                base_class.append("Transient")
-                sub_class.append("SN Ia")
+    candidates = pd.concat(sheets, ignore_index=True)
 
-            elif "SN" in crow["Classification"]:
-                base_class.append("Transient")
-                sub_class.append(crow["Classification"])
+    candidates["max_brightness"] = maxb
+    candidates["max_range"] = maxr
+    candidates["base_class"] = base_class
+    candidates["sub_class"] = sub_class
 
-            elif crow["Classification"] in ["II/IIb"]:
-                base_class.append("Transient")
-                sub_class.append("SN II/IIb")
+    mask = candidates["base_class"] == "AGN"
+    candidates.loc[mask, "base_class"] = "AGN Variability"
 
-            elif crow["Classification"] in ["TDE", "Dwarf Nova"]:
-                base_class.append("Transient")
-                sub_class.append(crow["Classification"])
+    return candidates
 
-            else:
-                base_class.append(crow["Classification"])
-                sub_class.append(crow["Classification"])
 
-candidates["max_brightness"] = maxb
-candidates["max_range"] = maxr
-candidates["base_class"] = base_class
-candidates["sub_class"] = sub_class
+with span("candidates.build"):
+    count_bytes_read(base_file)
+    candidates = build_candidates(obs)
 
-candidates["base_class"][candidates["base_class"] == "AGN"] = "AGN Variability"
+candidates = normalise(
+    candidates, candidate_columns, candidate_categories, name="candidates"
+)
@@ -0,0 +1,72 @@
+import argparse
+import logging
+import sys
+
+from nuztfpaper.build import build, is_up_to_date, jobs
+from nuztfpaper.style import output_folder, plot_dir
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        prog="nuztfpaper",
+        description="Regenerate figures and tables for the ZTF Neutrino Program paper",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser(
+        "build", help="Run all (or selected) figure and table jobs"
+    )
+    build_parser.add_argument(
+        "jobs", nargs="*", help="Jobs to run, with their dependencies. Default: all"
+    )
+    build_parser.add_argument(
+        "-j", "--jobs-parallel", type=int, default=None, help="Worker processes"
+    )
+    build_parser.add_argument(
+        "-f", "--force", action="store_true", help="Rerun up-to-date jobs"
+    )
+    build_parser.add_argument("--plot-dir", default=plot_dir)
+    build_parser.add_argument("--output-dir", default=output_folder)
+    build_parser.add_argument(
+        "--timeout", type=int, default=None, help="Timeout per cell (s)"
+    )
+    build_parser.add_argument("-v", "--verbose", action="store_true")
+
+    list_parser = subparsers.add_parser("list", help="List jobs and their status")
+    list_parser.add_argument("--plot-dir", default=plot_dir)
+    list_parser.add_argument("--output-dir", default=output_folder)
+
+    parsed = parser.parse_args(args)
+
+    logging.basicConfig(
+        level=logging.DEBUG if getattr(parsed, "verbose", False) else logging.INFO,
+        format="%(asctime)s %(levelname)s %(message)s",
+    )
+
+    if parsed.command == "list":
+        for job in jobs:
+            if is_up_to_date(job, parsed.plot_dir, parsed.output_dir):
+                state = "up to date"
+            else:
+                state = "stale"
+            deps = f" (after {', '.join(job.depends)})" if job.depends else ""
+            print(f"{job.name:<20} {state}{deps}")
+        return 0
+
+    status = build(
+        selected=parsed.jobs if len(parsed.jobs) > 0 else None,
+        n_workers=parsed.jobs_parallel,
+        force=parsed.force,
+        plot_folder=parsed.plot_dir,
+        output_dir=parsed.output_dir,
+        timeout=parsed.timeout,
+    )
+
+    for name, state in status.items():
+        print(f"{name:<20} {state}")
+
+    return int(any(x != "built" and x != "up to date" for x in status.values()))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
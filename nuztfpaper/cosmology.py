@@ -0,0 +1,141 @@
+import logging
+
+import numpy as np
+from astropy import units as u
+
+from nuztfpaper.style import cosmo
+
+logger = logging.getLogger(__name__)
+
+# (repr of cosmology, z_min, z_max, rtol) -> DistanceGrid
+_grids = {}
+
+
+class DistanceGrid:
+    """
+    Luminosity distance, distance modulus and comoving volume precomputed
+    on a dense log-spaced redshift grid, and evaluated by interpolation in
+    log-log space. The grid is refined until the relative interpolation error,
+    checked against the exact integrals at the midpoints of the grid, is below
+    rtol. Redshifts outside the grid are calculated exactly.
+    """
+
+    def __init__(
+        self,
+        cosmology=cosmo,
+        z_min: float = 1.0e-4,
+        z_max: float = 10.0,
+        n_points: int = 500,
+        rtol: float = 1.0e-5,
+        max_points: int = 100000,
+    ):
+        self.cosmology = cosmology
+        self.z_min = z_min
+        self.z_max = z_max
+
+        while True:
+            log_z = np.linspace(np.log(z_min), np.log(z_max), n_points)
+
+            log_dl = np.log(self._exact_dl(np.exp(log_z)))
+            log_vc = np.log(self._exact_vc(np.exp(log_z)))
+            log_dvc = np.log(self._exact_dvc(np.exp(log_z)))
+
+            mid_z = np.exp(0.5 * (log_z[1:] + log_z[:-1]))
+
+            err = 0.0
+            for log_y, exact in [
+                (log_dl, self._exact_dl(mid_z)),
+                (log_vc, self._exact_vc(mid_z)),
+                (log_dvc, self._exact_dvc(mid_z)),
+            ]:
+                interpolated = np.exp(np.interp(np.log(mid_z), log_z, log_y))
+                err = max(err, np.max(np.abs(interpolated / exact - 1.0)))
+
+            if err < rtol or 2 * n_points > max_points:
+                break
+
+            n_points *= 2
+
+        if err > rtol:
+            logger.warning(
+                f"Distance grid with {n_points} points only reaches a relative "
+                f"error of {err:.2e} (requested {rtol:.2e})"
+            )
+
+        self.log_z = log_z
+        self.log_dl = log_dl
+        self.log_vc = log_vc
+        self.log_dvc = log_dvc
+        self.n_points = n_points
+        self.max_rel_error = err
+
+        logger.debug(
+            f"Built distance grid for {cosmology.name} with {n_points} points "
+            f"over z={z_min}-{z_max}, max relative error {err:.2e}"
+        )
+
+    def _exact_dl(self, z):
+        return self.cosmology.luminosity_distance(z).to(u.Mpc).value
+
+    def _exact_vc(self, z):
+        return self.cosmology.comoving_volume(z).to(u.Gpc**3).value
+
+    def _exact_dvc(self, z):
+        dvc = self.cosmology.differential_comoving_volume(z)
+        return dvc.to(u.Gpc**3 / u.sr).value
+
+    def _interpolate(self, z, log_y, exact):
+        z = np.asarray(z, dtype=float)
+
+        # Redshifts outside the grid fall back to the exact astropy calculation
+        inside = (z >= self.z_min) & (z <= self.z_max)
+
+        if np.all(inside):
+            return np.exp(np.interp(np.log(z), self.log_z, log_y))
+
+        logger.debug(
+            f"Redshift outside distance grid range {self.z_min}-{self.z_max}, "
+            f"using exact calculation"
+        )
+
+        y = np.array(exact(z), dtype=float)
+        y[inside] = np.exp(np.interp(np.log(z[inside]), self.log_z, log_y))
+
+        return y
+
+    def luminosity_distance(self, z):
+        return self._interpolate(z, self.log_dl, self._exact_dl) * u.Mpc
+
+    def distmod(self, z):
+        dl = self._interpolate(z, self.log_dl, self._exact_dl) * 1.0e6
+        return (5.0 * np.log10(dl) - 5.0) * u.mag
+
+    def comoving_volume(self, z):
+        return self._interpolate(z, self.log_vc, self._exact_vc) * u.Gpc**3
+
+    def differential_comoving_volume(self, z):
+        dvc = self._interpolate(z, self.log_dvc, self._exact_dvc)
+        return dvc * u.Gpc**3 / u.sr
+
+
+def get_distance_grid(
+    cosmology=cosmo,
+    z_min: float = 1.0e-4,
+    z_max: float = 10.0,
+    rtol: float = 1.0e-5,
+) -> DistanceGrid:
+    """
+    Return the distance grid for a cosmology, building it on first use
+
+    :param cosmology: Astropy cosmology, default the FlatLambdaCDM in style.py
+    :param z_min: Minimum redshift of grid
+    :param z_max: Maximum redshift of grid
+    :param rtol: Maximum relative interpolation error
+    :return: DistanceGrid
+    """
+    key = (repr(cosmology), z_min, z_max, rtol)
+
+    if key not in _grids:
+        _grids[key] = DistanceGrid(cosmology, z_min=z_min, z_max=z_max, rtol=rtol)
+
+    return _grids[key]
@@ -0,0 +1,441 @@
+import glob
+import json
+import logging
+import os
+import queue
+import shutil
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pandas as pd
+
+from nuztfpaper.style import data_dir
+
+logger = logging.getLogger(__name__)
+
+archive_dir = os.path.join(data_dir, "alert_archive/")
+drop_dir = os.path.join(data_dir, "alert_drop/")
+
+followed_up_key = "followed_up"
+
+# Columns share their names with the OVERVIEW_FU/OVERVIEW_NOT_FU sheets,
+# so that archived alerts can be appended directly to obs and non
+archive_columns = {
+    "Event": str,
+    followed_up_key: bool,
+    "Class": str,
+    "RA": float,
+    "Dec": float,
+    "Signalness": float,
+    "RA Unc (rectangle)": str,
+    "Dec Unc (rectangle)": str,
+    "Area (rectangle)": float,
+    "Observed area (corrected for chip gaps)": float,
+    "Rejection reason": str,
+    "Additional ZTF GCN": str,
+    "Time": str,
+    "Source file": str,
+}
+
+# Lower-case GCN notice keys -> archive columns
+gcn_keys = {
+    "event": "Event",
+    "name": "Event",
+    "ra": "RA",
+    "dec": "Dec",
+    "signalness": "Signalness",
+    "trigger_time": "Time",
+    "alert_datetime": "Time",
+    "isotime": "Time",
+    "ra_uncertainty": "RA Unc (rectangle)",
+    "dec_uncertainty": "Dec Unc (rectangle)",
+}
+
+# Followed-up alerts are added to obs, which needs all of these
+followed_up_columns = [
+    "RA",
+    "Dec",
+    "RA Unc (rectangle)",
+    "Dec Unc (rectangle)",
+    "Observed area (corrected for chip gaps)",
+]
+
+true_strings = ["true", "yes", "1"]
+false_strings = ["false", "no", "0"]
+
+
+def parse_bool(value) -> bool:
+    """
+    Parse a boolean flag, accepting bools, 0/1 and true/false/yes/no strings
+
+    :param value: Flag
+    :return: Boolean
+    """
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+
+    if isinstance(value, (int, float, np.integer, np.floating)) and value in [0, 1]:
+        return bool(value)
+
+    if isinstance(value, str):
+        if value.strip().lower() in true_strings:
+            return True
+        if value.strip().lower() in false_strings:
+            return False
+
+    raise ValueError(f"Could not parse '{value}' as true or false")
+
+
+def parse_uncertainty(value):
+    """
+    Convert a rectangle uncertainty to the workbook format, a JSON list of the
+    positive and negative errors, e.g. "[0.57, -0.77]". A single number is
+    taken as a symmetric error.
+
+    :param value: List, JSON string or number
+    :return: JSON string
+    """
+    if isinstance(value, str):
+        value = json.loads(value)
+
+    if np.ndim(value) == 0:
+        value = [abs(float(value)), -abs(float(value))]
+
+    if len(value) != 2:
+        raise ValueError(f"Uncertainty {value} should have two entries")
+
+    return json.dumps([float(x) for x in value])
+
+
+def to_record(raw: dict, source: str = None) -> dict:
+    """
+    Convert a raw alert dictionary into an archive record.
+    Keys can be either archive column names or common GCN notice keys.
+
+    An alert counts as followed up if it has an observed area and no rejection
+    reason, unless 'followed_up' is given explicitly. Followed-up alerts must
+    have a position, rectangle uncertainties and an observed area.
+
+    :param raw: Alert dictionary
+    :param source: File the alert was read from
+    :return: Record
+    """
+    record = {}
+
+    for key, value in raw.items():
+        if key in archive_columns:
+            column = key
+        elif key.lower() in gcn_keys:
+            column = gcn_keys[key.lower()]
+        else:
+            continue
+
+        if column == "Event" and "Event" in record:
+            if str(record["Event"]).strip() != str(value).strip():
+                raise ValueError(
+                    f"Alert from {source} has conflicting event names "
+                    f"'{record['Event']}' and '{value}'"
+                )
+
+        record.setdefault(column, value)
+
+    if "Event" not in record:
+        raise ValueError(f"Alert from {source} has no event name")
+
+    # Convert strictly, so that e.g. "10.5 deg" is rejected rather than archived
+    # as NaN
+    for key, dtype in archive_columns.items():
+        if dtype is float and key in record and not _is_missing(record[key]):
+            try:
+                record[key] = float(record[key])
+            except (TypeError, ValueError):
+                raise ValueError(
+                    f"Alert {record['Event']} has invalid {key} '{record[key]}'"
+                )
+
+    for key in ["RA Unc (rectangle)", "Dec Unc (rectangle)"]:
+        if key in record and not _is_missing(record[key]):
+            record[key] = parse_uncertainty(record[key])
+
+    if followed_up_key in record:
+        record[followed_up_key] = parse_bool(record[followed_up_key])
+    else:
+        if not pd.isnull(record.get("Rejection reason")):
+            record[followed_up_key] = False
+        elif not pd.isnull(record.get("Observed area (corrected for chip gaps)")):
+            record[followed_up_key] = True
+        else:
+            raise ValueError(
+                f"Alert {record['Event']} has neither a rejection reason "
+                f"nor an observed area, so cannot be archived yet"
+            )
+
+    if record[followed_up_key]:
+        missing = [x for x in followed_up_columns if _is_missing(record.get(x))]
+        if len(missing) > 0:
+            raise ValueError(
+                f"Alert {record['Event']} was followed up, but is missing {missing}"
+            )
+
+    record["Source file"] = source
+
+    return record
+
+
+def incomplete_followed_up(df: pd.DataFrame) -> pd.Series:
+    """
+    Find followed-up alerts which lack any of the fields needed for obs
+
+    :param df: Dataframe in the archive schema
+    :return: Boolean mask of incomplete followed-up alerts
+    """
+    followed_up = df[followed_up_key].map(parse_bool).astype(bool)
+    missing = df.reindex(columns=followed_up_columns).isnull().any(axis=1)
+    return followed_up & missing
+
+
+def _is_missing(value) -> bool:
+    # Lists (e.g. uncertainties) are never missing, pd.isnull would check each entry
+    return np.ndim(value) == 0 and pd.isnull(value)
+
+
+def parse_json(path: str) -> list:
+    """
+    Read alerts from a JSON file, containing either one alert or a list of them
+
+    :param path: Path to JSON file
+    :return: List of records
+    """
+    with open(path, "r") as f:
+        raw = json.load(f)
+
+    if isinstance(raw, dict):
+        raw = [raw]
+
+    return [to_record(x, source=os.path.basename(path)) for x in raw]
+
+
+def _find(root, tag: str):
+    # VOEvent elements may or may not carry the namespace
+    for element in root.iter():
+        if element.tag.split("}")[-1] == tag:
+            return element
+    return None
+
+
+def parse_voevent(path: str, extra: dict = None) -> list:
+    """
+    Read an IceCube alert VOEvent. The event name is taken from a 'name' or
+    'event' parameter if present, otherwise from the file name (e.g. IC230101A.xml).
+    Follow-up information (observed area or rejection reason) can be given as
+    extra Params with the archive column names, or via extra.
+
+    :param path: Path to VOEvent XML file
+    :param extra: Additional fields for the record
+    :return: List containing one record
+    """
+    root = ET.parse(path).getroot()
+
+    raw = {}
+
+    for element in root.iter():
+        if element.tag.split("}")[-1] == "Param":
+            name = element.get("name")
+            value = element.get("value")
+            if name is None:
+                continue
+            if name in archive_columns or name.lower() in gcn_keys:
+                raw[name] = value
+
+    position = _find(root, "Position2D")
+    if position is not None:
+        raw["RA"] = float(_find(position, "C1").text)
+        raw["Dec"] = float(_find(position, "C2").text)
+
+    iso_time = _find(root, "ISOTime")
+    if iso_time is not None:
+        raw["Time"] = iso_time.text.strip()
+
+    if extra is not None:
+        raw.update(extra)
+
+    names = [x for x in raw if x == "Event" or gcn_keys.get(x.lower()) == "Event"]
+    if len(names) == 0:
+        raw["Event"] = os.path.splitext(os.path.basename(path))[0]
+
+    return [to_record(raw, source=os.path.basename(path))]
+
+
+def parse_file(path: str) -> list:
+    if path.endswith(".json"):
+        return parse_json(path)
+    elif path.endswith(".xml"):
+        return parse_voevent(path)
+    else:
+        raise ValueError(f"Unrecognised alert file format: {path}")
+
+
+def records_to_frame(records: list) -> pd.DataFrame:
+    """
+    Convert records to a dataframe with the archive schema
+
+    :param records: List of records
+    :return: Dataframe
+    """
+    df = pd.DataFrame.from_records(records, columns=list(archive_columns))
+
+    for col, dtype in archive_columns.items():
+        if dtype is float:
+            df[col] = pd.to_numeric(df[col]).astype(np.float64)
+        elif dtype is bool:
+            df[col] = df[col].map(parse_bool).astype(bool)
+        else:
+            # Missing strings are NaN, as in the workbook
+            df[col] = df[col].map(
+                lambda x: np.nan if _is_missing(x) else str(x).strip()
+            )
+
+    return df
+
+
+def load_archive(path: str = archive_dir) -> pd.DataFrame:
+    """
+    Load all archived alert batches, in the order they were appended
+
+    :param path: Archive directory
+    :return: Dataframe of archived alerts
+    """
+    batches = sorted(glob.glob(os.path.join(path, "batch_*.parquet")))
+
+    if len(batches) == 0:
+        return records_to_frame([])
+
+    # Older batches may lack newer columns
+    archive = pd.concat([pd.read_parquet(x) for x in batches], ignore_index=True)
+    return archive.reindex(columns=list(archive_columns))
+
+
+def append_records(
+    records: list,
+    known_events: set = None,
+    path: str = archive_dir,
+) -> pd.DataFrame:
+    """
+    Append new alerts to the archive as a new columnar batch file.
+    Existing batches are never rewritten. Events which are already in the
+    archive (or in known_events) are skipped.
+
+    :param records: List of records
+    :param known_events: Events which are already known, e.g. from the workbook
+    :param path: Archive directory
+    :return: Dataframe of newly archived alerts
+    """
+    new = records_to_frame(records)
+
+    # Never archive anything that alerts.add_alerts would reject
+    incomplete = new[incomplete_followed_up(new)]
+    if len(incomplete) > 0:
+        raise ValueError(
+            f"Followed-up alerts {list(incomplete['Event'])} are missing "
+            f"some of {followed_up_columns}, so cannot be archived"
+        )
+
+    known = set(load_archive(path)["Event"])
+    if known_events is not None:
+        known |= set(known_events)
+
+    new = new[~new["Event"].isin(known)].drop_duplicates(subset="Event")
+
+    if len(new) > 0:
+        os.makedirs(path, exist_ok=True)
+        batch_path = os.path.join(path, f"batch_{time.time_ns()}.parquet")
+        new.to_parquet(batch_path, index=False)
+        logger.info(f"Archived {len(new)} new alerts to {batch_path}")
+
+    return new.reset_index(drop=True)
+
+
+def _update_loaded_tables(new: pd.DataFrame):
+    # Only update the derived tables if they have already been loaded,
+    # otherwise they will pick up the archive when first imported
+    if "nuztfpaper.alerts" in sys.modules and len(new) > 0:
+        sys.modules["nuztfpaper.alerts"].add_alerts(new)
+
+
+def _known_events() -> set:
+    if "nuztfpaper.alerts" in sys.modules:
+        return set(sys.modules["nuztfpaper.alerts"].joint["Event"])
+    return set()
+
+
+def ingest_records(records: list, path: str = archive_dir) -> pd.DataFrame:
+    """
+    Archive a list of alert records, and update obs/non/joint if loaded.
+    The tables are replaced rather than modified, so reread them from
+    nuztfpaper.alerts afterwards (see nuztfpaper.alerts.add_alerts).
+
+    :param records: List of raw alert dictionaries or records
+    :param path: Archive directory
+    :return: Dataframe of newly archived alerts
+    """
+    records = [to_record(x, source=x.get("Source file")) for x in records]
+    new = append_records(records, known_events=_known_events(), path=path)
+    _update_loaded_tables(new)
+    return new
+
+
+def ingest_queue(alert_queue: queue.Queue, path: str = archive_dir) -> pd.DataFrame:
+    """
+    Drain all alert dictionaries currently waiting in a local queue,
+    and archive them as a single batch
+
+    :param alert_queue: Queue of alert dictionaries
+    :param path: Archive directory
+    :return: Dataframe of newly archived alerts
+    """
+    records = []
+    while True:
+        try:
+            records.append(alert_queue.get_nowait())
+        except queue.Empty:
+            break
+
+    return ingest_records(records, path=path)
+
+
+def ingest_drop_dir(directory: str = drop_dir, path: str = archive_dir):
+    """
+    Archive all GCN JSON (.json) and VOEvent (.xml) files in a drop directory.
+    Processed files are moved to a 'processed' subdirectory, and files which
+    cannot be parsed to a 'failed' subdirectory.
+
+    :param directory: Drop directory
+    :param path: Archive directory
+    :return: Dataframe of newly archived alerts
+    """
+    records = []
+    done = []
+
+    files = sorted(
+        glob.glob(os.path.join(directory, "*.json"))
+        + glob.glob(os.path.join(directory, "*.xml"))
+    )
+
+    for file in files:
+        try:
+            records += parse_file(file)
+            done.append((file, "processed"))
+        except (ValueError, TypeError, KeyError, AttributeError, ET.ParseError) as e:
+            logger.error(f"Could not ingest {file}: {e}")
+            done.append((file, "failed"))
+
+    new = append_records(records, known_events=_known_events(), path=path)
+    _update_loaded_tables(new)
+
+    for file, state in done:
+        os.makedirs(os.path.join(directory, state), exist_ok=True)
+        shutil.move(file, os.path.join(directory, state, os.path.basename(file)))
+
+    return new
@@ -6,13 +6,15 @@ import astropy.time
 from astropy import units as u
 from nuztf.neutrino_scanner import NeutrinoScanner
 
-from nuztfpaper.alerts import data_dir
+from nuztfpaper.profiling import count, count_bytes_read, timed
+from nuztfpaper.style import data_dir
 
 logger = logging.getLogger(__name__)
 
 latency_cache_path = os.path.join(data_dir, "latency_cache.pkl")
 
 
+@timed("calculate_latency")
 def calculate_latency(nu_name: str, first_det_window_days=3):
     try:
         nu = NeutrinoScanner(nu_name)
@@ -24,15 +26,20 @@ def calculate_latency(nu_name: str, first_det_window_days=3):
         return None
 
 
+@timed("get_latency")
 def get_latency(nu_name):
     cache = None
 
     if os.path.isfile(latency_cache_path):
+        count_bytes_read(latency_cache_path)
         with open(latency_cache_path, "rb") as f:
             cache = pickle.load(f)
             if nu_name in cache.keys():
+                count("latency_cache.hit")
                 return cache[nu_name]
 
+    count("latency_cache.miss")
+
     logger.info(
         f"No cached latency value for {nu_name}."
         f"Will calculate then save value in cache."
@@ -40,6 +47,12 @@ def get_latency(nu_name):
 
     res = calculate_latency(nu_name)
 
+    # Other processes (e.g. parallel notebook kernels) may have added entries
+    # in the meantime, so merge with the latest cache
+    if os.path.isfile(latency_cache_path):
+        with open(latency_cache_path, "rb") as f:
+            cache = pickle.load(f)
+
     new_entry = {nu_name: res}
 
     if cache is None:
@@ -47,7 +60,12 @@ def get_latency(nu_name):
     else:
         new_cache = dict(cache, **new_entry)
 
-    with open(latency_cache_path, "wb") as f:
+    # Write atomically, so that readers never see a truncated file
+    tmp_path = f"{latency_cache_path}.{os.getpid()}.tmp"
+
+    with open(tmp_path, "wb") as f:
         pickle.dump(new_cache, f)
 
+    os.replace(tmp_path, latency_cache_path)
+
     return res
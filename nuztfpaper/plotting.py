@@ -13,6 +13,8 @@ from nuztf.parse_nu_gcn import find_gcn_no, parse_gcn_circular
 from nuztf.plot import alert_to_pandas
 from ztfquery.io import LOCALSOURCE
 
+from nuztfpaper.cosmology import get_distance_grid
+from nuztfpaper.profiling import count, count_bytes_read, span, timed
 from nuztfpaper.style import (base_height, base_width, big_fontsize, cosmo,
                               dpi, plot_dir)
 
@@ -21,6 +23,7 @@ logger = logging.getLogger(__name__)
 ALERT_MOD = 1.2
 
 
+@timed("plot_alerts")
 def plot_alerts(
     source_name: str,
     nu_name: list = None,
@@ -41,7 +44,8 @@ def plot_alerts(
     if source_coords is None:
 
         # Try ampel to find ZTF
-        res = ampel_api_name(source_name, with_history=False)[0]
+        with span("plot_alerts.ampel_fetch"):
+            res = ampel_api_name(source_name, with_history=False)[0]
         source_coords = [res["candidate"]["ra"], res["candidate"]["dec"]]
         logger.info(f"Found ZTF coordinates for source {source_name}")
 
@@ -56,14 +60,19 @@ def plot_alerts(
     ul_cache_path = os.path.join(cache_dir, f'{source_name.replace(" ", "")}_ul.csv')
 
     if from_cache:
+        count("alert_cache.hit")
         logger.debug(f"Loading from {cache_path}")
+        count_bytes_read(cache_path)
         df = pd.read_csv(cache_path)
         logger.debug(f"Loading from {ul_cache_path}")
+        count_bytes_read(ul_cache_path)
         ul = pd.read_csv(ul_cache_path)
 
     else:
+        count("alert_cache.miss")
 
-        res = ampel_api_name(source_name, with_history=True)
+        with span("plot_alerts.ampel_fetch"):
+            res = ampel_api_name(source_name, with_history=True)
         df, ul = alert_to_pandas(res)
 
         logger.debug(f"Saving to {cache_path}")
@@ -97,16 +106,15 @@ def plot_alerts(
 
         redshift = 1.0 + source_redshift
 
+        distances = get_distance_grid(cosmo)
+
         if plot_mag:
-            dist_mod = 5 * (
-                np.log10(cosmo.luminosity_distance(z=(redshift - 1)).to(u.pc).value)
-                - 1.0
-            )
+            dist_mod = distances.distmod(redshift - 1).value
         else:
             conversion_factor = (
                 4
                 * np.pi
-                * cosmo.luminosity_distance(z=(redshift - 1)).to(u.cm) ** 2.0
+                * distances.luminosity_distance(redshift - 1).to(u.cm) ** 2.0
                 / (redshift)
             )
 
@@ -171,16 +179,17 @@ def plot_alerts(
 
         else:
 
-            flux_j = mags.to(u.Jansky)
+            with span("plot_alerts.unit_conversion"):
+                flux_j = mags.to(u.Jansky)
 
-            f = (const.c / (wl[fc] * u.nm)).to("Hz")
+                f = (const.c / (wl[fc] * u.nm)).to("Hz")
 
-            flux = (flux_j * f).to("erg cm-2 s-1")
+                flux = (flux_j * f).to("erg cm-2 s-1")
 
-            jerrs = magerrs.to(u.Jansky)
-            ferrs = (jerrs * f).to("erg cm-2 s-1").value - flux.value
+                jerrs = magerrs.to(u.Jansky)
+                ferrs = (jerrs * f).to("erg cm-2 s-1").value - flux.value
 
-            uls = (limmags.to(u.Jansky) * f).to("erg cm-2 s-1")
+                uls = (limmags.to(u.Jansky) * f).to("erg cm-2 s-1")
 
             ax.errorbar(
                 data["mjd"][mask],
@@ -269,8 +278,9 @@ def plot_alerts(
         nu_name = [nu_name]
 
     for j, nu in enumerate(nu_name):
-        gcn_no = find_gcn_no(nu)
-        gcn_info = parse_gcn_circular(gcn_no)
+        with span("plot_alerts.gcn_fetch"):
+            gcn_no = find_gcn_no(nu)
+            gcn_info = parse_gcn_circular(gcn_no)
 
         ax.axvline(gcn_info["time"].mjd, linestyle=":", label=nu, color=f"C{j}")
 
@@ -331,9 +341,10 @@ def plot_alerts(
 
     logger.info(f"Saving to {output_path}")
 
-    plt.savefig(output_path, bbox_inches="tight", pad_inches=0.00)
+    with span("plot_alerts.savefig"):
+        plt.savefig(output_path, bbox_inches="tight", pad_inches=0.00)
 
-    if extra_folder is not None:
-        extra_path = os.path.join(extra_folder, f"{filename}")
-        logger.info(f"Saving to {extra_path}")
-        plt.savefig(extra_path, bbox_inches="tight", pad_inches=0.00)
+        if extra_folder is not None:
+            extra_path = os.path.join(extra_folder, f"{filename}")
+            logger.info(f"Saving to {extra_path}")
+            plt.savefig(extra_path, bbox_inches="tight", pad_inches=0.00)
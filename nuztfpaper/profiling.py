@@ -0,0 +1,241 @@
+import atexit
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import nullcontext
+
+logger = logging.getLogger(__name__)
+
+# Set to 1 to record spans, or to a file path (.jsonl or .json) to also export
+# the recorded spans when the interpreter exits. A "{pid}" in the path is
+# replaced by the process id, so that parallel workers do not overwrite each other
+profile_env_var = "NUZTFPAPER_PROFILE"
+
+_env_value = os.environ.get(profile_env_var, "")
+
+enabled = _env_value not in ["", "0"]
+
+spans = []
+counters = defaultdict(int)
+
+_lock = threading.Lock()
+_local = threading.local()
+_epoch_ns = time.perf_counter_ns()
+_null_span = nullcontext()
+
+
+class Span:
+    def __init__(self, name: str, **metadata):
+        self.name = name
+        self.metadata = metadata
+        self.counters = defaultdict(int)
+        self.start_ns = None
+        self.end_ns = None
+
+    def __enter__(self):
+        stack = _get_stack()
+        self.parent = stack[-1].name if len(stack) > 0 else None
+        stack.append(self)
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.end_ns = time.perf_counter_ns()
+        _get_stack().pop()
+        with _lock:
+            spans.append(self.to_dict())
+        return False
+
+    @property
+    def duration_s(self) -> float:
+        return (self.end_ns - self.start_ns) * 1e-9
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "parent": self.parent,
+            "start_us": (self.start_ns - _epoch_ns) / 1e3,
+            "duration_us": (self.end_ns - self.start_ns) / 1e3,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "counters": dict(self.counters),
+            "metadata": self.metadata,
+        }
+
+
+def _get_stack() -> list:
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    with _lock:
+        spans.clear()
+        counters.clear()
+
+
+def span(name: str, **metadata):
+    """
+    Context manager timing a named pipeline stage.
+    Returns a shared no-op context when profiling is disabled.
+
+    :param name: Name of stage
+    :param metadata: Extra JSON-serialisable information to store with the span
+    :return: Context manager
+    """
+    if not enabled:
+        return _null_span
+    return Span(name, **metadata)
+
+
+def timed(name: str = None):
+    """
+    Decorator recording a span for every call of the wrapped function
+
+    :param name: Name of span, defaults to the function's qualified name
+    :return: Decorator
+    """
+
+    def decorator(func):
+        span_name = name if name is not None else func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            with Span(span_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count(name: str, n: int = 1):
+    """
+    Increment a global counter, and the same counter on the innermost open span
+
+    :param name: Name of counter
+    :param n: Increment
+    :return: None
+    """
+    if not enabled:
+        return
+    with _lock:
+        counters[name] += n
+    stack = _get_stack()
+    if len(stack) > 0:
+        stack[-1].counters[name] += n
+
+
+def count_bytes_read(path: str):
+    """
+    Record the size of a file which has been read from disk
+
+    :param path: Path of file
+    :return: None
+    """
+    if not enabled:
+        return
+    try:
+        count("bytes_read", os.path.getsize(path))
+    except OSError:
+        pass
+
+
+def export_jsonl(path: str):
+    """
+    Write all recorded spans, followed by a counter summary, as JSON lines
+
+    :param path: Output path
+    :return: None
+    """
+    with _lock:
+        records = list(spans)
+        totals = dict(counters)
+
+    with open(path, "w") as f:
+        for record in records:
+            f.write(json.dumps(record, default=str) + "\n")
+        f.write(json.dumps({"name": "counters", "counters": totals}) + "\n")
+
+    logger.info(f"Saved {len(records)} spans to {path}")
+
+
+def export_chrome_trace(path: str):
+    """
+    Write all recorded spans in the Chrome trace event format,
+    which can be opened with chrome://tracing or https://ui.perfetto.dev
+
+    :param path: Output path
+    :return: None
+    """
+    with _lock:
+        records = list(spans)
+        totals = dict(counters)
+
+    events = []
+    for record in records:
+        events.append(
+            {
+                "name": record["name"],
+                "ph": "X",
+                "ts": record["start_us"],
+                "dur": record["duration_us"],
+                "pid": record["pid"],
+                "tid": record["tid"],
+                "args": dict(record["metadata"], **record["counters"]),
+            }
+        )
+
+    for key, value in totals.items():
+        events.append(
+            {
+                "name": key,
+                "ph": "C",
+                "ts": 0,
+                "pid": os.getpid(),
+                "args": {key: value},
+            }
+        )
+
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, default=str)
+
+    logger.info(f"Saved {len(records)} spans to {path}")
+
+
+def export(path: str):
+    """
+    Export spans, choosing JSON lines for '.jsonl' paths and Chrome trace otherwise
+
+    :param path: Output path
+    :return: None
+    """
+    if path.endswith(".jsonl"):
+        export_jsonl(path)
+    else:
+        export_chrome_trace(path)
+
+
+def _export_at_exit():
+    export(_env_value.format(pid=os.getpid()))
+
+
+if enabled and _env_value != "1":
+    atexit.register(_export_at_exit)
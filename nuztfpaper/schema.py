@@ -0,0 +1,155 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+obs_columns = [
+    "Event",
+    "RA",
+    "Dec",
+    "Signalness",
+    "Area (rectangle)",
+    "Observed area (corrected for chip gaps)",
+    "Latency (hours)",
+]
+
+non_columns = [
+    "Event",
+    "Rejection reason",
+]
+
+alert_categories = [
+    "Rejection reason",
+]
+
+candidate_columns = [
+    "Name",
+    "IAU Name",
+    "Classification",
+    "max brightness",
+    "neutrino",
+    "max_brightness",
+    "max_range",
+    "base_class",
+    "sub_class",
+]
+
+candidate_categories = [
+    "Classification",
+    "neutrino",
+    "base_class",
+    "sub_class",
+]
+
+
+def clean_strings(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Strip stray whitespace and newlines (e.g. "AGN\\n") from all string entries.
+    Non-string entries in mixed columns are left untouched.
+
+    :param df: Dataframe
+    :return: Dataframe with cleaned strings
+    """
+    for col in df.columns:
+        if df[col].dtype == object or pd.api.types.is_string_dtype(df[col].dtype):
+            df[col] = df[col].map(lambda x: x.strip() if isinstance(x, str) else x)
+    return df
+
+
+def downcast_numeric(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Downcast numeric columns to the smallest dtype which holds them exactly.
+    Integers are always downcast, floats only become float32 if no value changes.
+
+    :param df: Dataframe
+    :return: Dataframe with downcast numeric columns
+    """
+    for col in df.columns:
+        kind = df[col].dtype.kind
+
+        if kind in "iu":
+            df[col] = pd.to_numeric(df[col], downcast="integer")
+
+        elif kind == "f" and df[col].dtype.itemsize > 4:
+            values = df[col].to_numpy()
+            small = values.astype(np.float32)
+            if np.array_equal(small.astype(values.dtype), values, equal_nan=True):
+                df[col] = small
+
+    return df
+
+
+def categorise(df: pd.DataFrame, columns: list) -> pd.DataFrame:
+    """
+    Convert columns with repeated labels to categoricals
+
+    :param df: Dataframe
+    :param columns: Columns to convert, missing columns are skipped
+    :return: Dataframe with categorical columns
+    """
+    for col in columns:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    return df
+
+
+def validate(df: pd.DataFrame, columns: list, categories: list = None, name="table"):
+    """
+    Check that a table has all expected columns, and that label columns are
+    categorical
+
+    :param df: Dataframe
+    :param columns: Required columns
+    :param categories: Columns which must be categorical, if present
+    :param name: Name of table for error messages
+    :return: None
+    """
+    missing = [x for x in columns if x not in df.columns]
+
+    if len(missing) > 0:
+        err = f"Table '{name}' is missing expected columns: {missing}"
+        logger.error(err)
+        raise ValueError(err)
+
+    if categories is not None:
+        for col in categories:
+            if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+                err = f"Column '{col}' of table '{name}' is not categorical"
+                logger.error(err)
+                raise ValueError(err)
+
+
+def normalise(
+    df: pd.DataFrame,
+    columns: list,
+    categories: list,
+    name: str = "table",
+) -> pd.DataFrame:
+    """
+    Clean strings, downcast numbers and categorise labels once, then
+    validate the resulting schema
+
+    :param df: Dataframe
+    :param columns: Required columns
+    :param categories: Columns to convert to categoricals
+    :param name: Name of table for logging and error messages
+    :return: Normalised dataframe
+    """
+    old_size = df.memory_usage(deep=True).sum()
+
+    df = df.copy()
+    df = clean_strings(df)
+    df = downcast_numeric(df)
+    df = categorise(df, categories)
+
+    validate(df, columns, categories, name=name)
+
+    new_size = df.memory_usage(deep=True).sum()
+
+    logger.debug(
+        f"Normalised table '{name}' from {old_size/1e3:.1f} kB to {new_size/1e3:.1f} kB"
+    )
+
+    return df
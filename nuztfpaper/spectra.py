@@ -1,13 +1,31 @@
+import json
+import logging
+import multiprocessing
 import os
+import sys
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
 
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 from astropy.table import Table
 
+from nuztfpaper.profiling import count, count_bytes_read, span, timed
 from nuztfpaper.style import (base_height, base_width, big_fontsize, data_dir,
                               dpi, output_folder, plot_dir)
 
+logger = logging.getLogger(__name__)
+
+# JSON list of shared spectrum handles, read by worker processes on import
+shared_spectra_env_var = "NUZTFPAPER_SHARED_SPECTRA"
+
+# (path, smooth) -> read-only dataframe backed by shared memory
+_shared_spectra = {}
+_attached_memory = []
+# Names of blocks created by SharedSpectra in this process
+_owned_memory = set()
+
 all_lines = {
     "H": [
         (r"$\rm{H\alpha}$", 6562.8, 0),
@@ -17,7 +35,15 @@ all_lines = {
 }
 
 
+@timed("load_spectrum")
 def load_spectrum(path: str, smooth: int = 1):
+    key = (path, smooth)
+    if key in _shared_spectra:
+        count("shared_spectra.hit")
+        return _shared_spectra[key].copy(deep=False)
+
+    count_bytes_read(os.path.join(data_dir, path))
+
     if ".fits" in path:
         raw = Table.read(os.path.join(data_dir, path), format="fits")
         data = raw.to_pandas()
@@ -49,6 +75,145 @@ def load_spectrum(path: str, smooth: int = 1):
         return data
 
 
+class SharedSpectra:
+    """
+    Spectra loaded once by a parent process and placed in shared memory,
+    so that parallel plotting workers can read them without copies.
+
+    Only numeric columns are shared, with their original dtypes, laid out one
+    after another in a single block per spectrum.
+    """
+
+    def __init__(self, spectra: list = None):
+        self.handles = []
+        self.memory = []
+
+        if spectra is not None:
+            for path, smooth in spectra:
+                self.add(path, smooth)
+
+    def add(self, path: str, smooth: int = 1):
+        if any(x["path"] == path and x["smooth"] == smooth for x in self.handles):
+            return
+
+        data = load_spectrum(path, smooth=smooth)
+
+        columns = []
+        offset = 0
+
+        for col in data.columns:
+            if not np.issubdtype(data[col].dtype, np.number):
+                continue
+            dtype = data[col].dtype.newbyteorder("=")
+            columns.append({"name": str(col), "dtype": dtype.str, "offset": offset})
+            # Keep every column 8-byte aligned
+            offset += -(-len(data) * dtype.itemsize // 8) * 8
+
+        shm = SharedMemory(create=True, size=max(offset, 1))
+        _owned_memory.add(shm.name)
+
+        for col in columns:
+            shared = np.ndarray(
+                len(data), dtype=col["dtype"], buffer=shm.buf, offset=col["offset"]
+            )
+            shared[:] = data[col["name"]].to_numpy()
+
+        self.memory.append(shm)
+        self.handles.append(
+            {
+                "path": path,
+                "smooth": smooth,
+                "name": shm.name,
+                "length": len(data),
+                "columns": columns,
+            }
+        )
+
+        logger.debug(
+            f"Shared {path} (smooth={smooth}), {offset/1e3:.1f} kB as {shm.name}"
+        )
+
+    def to_json(self) -> str:
+        return json.dumps(self.handles)
+
+    def close(self):
+        for shm in self.memory:
+            _owned_memory.discard(shm.name)
+            shm.close()
+            shm.unlink()
+        self.memory = []
+        self.handles = []
+
+    def __enter__(self):
+        os.environ[shared_spectra_env_var] = self.to_json()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        os.environ.pop(shared_spectra_env_var, None)
+        self.close()
+        return False
+
+
+def _open_shared_memory(name: str) -> SharedMemory:
+    if sys.version_info >= (3, 13):
+        return SharedMemory(name=name, track=False)
+
+    shm = SharedMemory(name=name)
+
+    # Children created by multiprocessing (fork or spawn) share the parent's
+    # resource tracker, where the block is already registered by its owner.
+    # Independent processes, such as notebook kernels, start their own tracker,
+    # which would unlink the block when they exit unless it is unregistered.
+    # The owner itself must keep its registration, so the block is still
+    # cleaned up if it crashes before close().
+    if multiprocessing.parent_process() is None and name not in _owned_memory:
+        resource_tracker.unregister(shm._name, "shared_memory")
+
+    return shm
+
+
+def attach_shared_spectra(handles: list | str = None):
+    """
+    Make spectra shared by a parent process available to load_spectrum.
+    Can be used as a process pool initializer.
+
+    :param handles: Handles from SharedSpectra (list or JSON string),
+        default read from the NUZTFPAPER_SHARED_SPECTRA environment variable
+    :return: None
+    """
+    if handles is None:
+        handles = os.environ.get(shared_spectra_env_var)
+        if handles is None:
+            return
+
+    if isinstance(handles, str):
+        handles = json.loads(handles)
+
+    for handle in handles:
+        try:
+            shm = _open_shared_memory(handle["name"])
+        except FileNotFoundError:
+            logger.warning(f"Shared memory for {handle['path']} no longer exists")
+            continue
+
+        columns = {}
+        for col in handle["columns"]:
+            values = np.ndarray(
+                handle["length"],
+                dtype=col["dtype"],
+                buffer=shm.buf,
+                offset=col["offset"],
+            )
+            values.flags.writeable = False
+            columns[col["name"]] = values
+
+        _attached_memory.append(shm)
+        _shared_spectra[(handle["path"], handle["smooth"])] = pd.DataFrame(
+            columns, copy=False
+        )
+
+
+@timed("plot_spectrum")
 def plot_spectrum(
     source_spectrum: tuple,
     comparison_spectrum: tuple = None,
@@ -67,7 +232,7 @@ def plot_spectrum(
     data_smoothed = load_spectrum(source_path, smooth=smooth)
 
     mask = data["flux"] > 0.0
-    data["flux"][~mask] = 0.00
+    data["flux"] = data["flux"].where(mask, 0.00)
 
     y_point = min(data_smoothed["flux"])
 
@@ -87,7 +252,7 @@ def plot_spectrum(
         host = load_spectrum(host_path)
 
         mask = np.logical_and(host["flux"] > 0.0, host["flux"] != np.nan)
-        host["flux"][~mask] = 0.00
+        host["flux"] = host["flux"].where(mask, 0.00)
 
         y_offset = max(data_smoothed["flux"]) / scale
 
@@ -171,7 +336,13 @@ def plot_spectrum(
     filename = f"{source_label}_spectrum.pdf"
 
     output_path = os.path.join(output_folder, f"{filename}")
-    plt.savefig(os.path.join(plot_dir, filename), bbox_inches="tight", pad_inches=0.00)
-    plt.savefig(output_path, bbox_inches="tight", pad_inches=0.00)
+    with span("plot_spectrum.savefig"):
+        plt.savefig(
+            os.path.join(plot_dir, filename), bbox_inches="tight", pad_inches=0.00
+        )
+        plt.savefig(output_path, bbox_inches="tight", pad_inches=0.00)
 
     return fig
+
+
+attach_shared_spectra()
@@ -1,4 +1,7 @@
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
+import pandas as pd
 from scipy.stats import chi2, norm
 
 
@@ -12,7 +15,128 @@ def poisson_interval(x, sigma=1, cl=None):
         onesided = norm.cdf(sigma)
 
     lower = chi2.ppf(1.0 - onesided, 2 * x) / 2.0
-    lower[np.isnan(lower)] = 0.0
+    lower = np.where(np.isnan(lower), 0.0, lower)
     upper = chi2.ppf(onesided, 2 * (x + 1)) / 2.0
 
     return lower, upper
+
+
+def bootstrap_weights(n_alerts: int, n_resamples: int, rng) -> np.ndarray:
+    """
+    Draw bootstrap resamples of alerts in bulk, as a matrix giving the number of
+    times each alert appears in each resample
+
+    :param n_alerts: Number of alerts
+    :param n_resamples: Number of resamples
+    :param rng: Numpy random generator
+    :return: Array of shape (n_resamples, n_alerts)
+    """
+    indices = rng.integers(0, n_alerts, size=(n_resamples, n_alerts))
+    offsets = indices + n_alerts * np.arange(n_resamples)[:, None]
+    weights = np.bincount(offsets.ravel(), minlength=n_resamples * n_alerts)
+    return weights.reshape(n_resamples, n_alerts)
+
+
+def _bootstrap_totals(counts: np.ndarray, n_resamples: int, seed) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return bootstrap_weights(len(counts), n_resamples, rng) @ counts
+
+
+def bootstrap_class_totals(
+    counts: np.ndarray,
+    n_resamples: int = 10000,
+    n_jobs: int = 1,
+    seed: int = None,
+) -> np.ndarray:
+    """
+    Bootstrap total class counts by resampling alerts with replacement
+
+    :param counts: Array of shape (n_alerts, n_classes) with candidates per class
+    :param n_resamples: Number of resamples
+    :param n_jobs: Number of processes to shard resamples across
+    :param seed: Random seed
+    :return: Array of shape (n_resamples, n_classes)
+    """
+    counts = np.asarray(counts)
+
+    if n_jobs <= 1:
+        return _bootstrap_totals(counts, n_resamples, seed)
+
+    seeds = np.random.SeedSequence(seed).spawn(n_jobs)
+    shards = [len(x) for x in np.array_split(np.arange(n_resamples), n_jobs)]
+
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        totals = executor.map(_bootstrap_totals, [counts] * n_jobs, shards, seeds)
+        return np.concatenate(list(totals), axis=0)
+
+
+def bootstrap_classes(
+    candidates,
+    alerts: list = None,
+    class_key: str = "base_class",
+    alert_key: str = "neutrino",
+    n_resamples: int = 10000,
+    sigma=1,
+    cl=None,
+    n_jobs: int = 1,
+    seed: int = None,
+):
+    """
+    Class fractions and per-alert rates of candidates, with bootstrap
+    uncertainties from resampling alerts
+
+    :param candidates: Candidate dataframe
+    :param alerts: All alerts to resample over, including those without
+        candidates. Default: all followed-up alerts in nuztfpaper.alerts.obs
+    :param class_key: Column with candidate class
+    :param alert_key: Column with alert name
+    :param n_resamples: Number of resamples
+    :param sigma: Width of interval in sigma, if cl is None
+    :param cl: Confidence level of interval
+    :param n_jobs: Number of processes to shard resamples across
+    :param seed: Random seed
+    :return: Dataframe indexed by class
+    """
+    table = pd.crosstab(
+        np.asarray(candidates[alert_key]), np.asarray(candidates[class_key])
+    )
+
+    if alerts is None:
+        from nuztfpaper.alerts import obs
+
+        alerts = obs["Event"]
+
+    table = table.reindex(index=list(alerts), fill_value=0)
+
+    counts = table.to_numpy()
+    n_alerts = len(counts)
+
+    totals = bootstrap_class_totals(
+        counts, n_resamples=n_resamples, n_jobs=n_jobs, seed=seed
+    )
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        fractions = totals / totals.sum(axis=1, keepdims=True)
+
+    if cl is None:
+        cl = 2.0 * norm.cdf(sigma) - 1.0
+
+    quantiles = [0.5 * (1.0 - cl), 0.5 * (1.0 + cl)]
+
+    frac_lower, frac_upper = np.nanquantile(fractions, quantiles, axis=0)
+    rate_lower, rate_upper = np.quantile(totals / n_alerts, quantiles, axis=0)
+
+    observed = counts.sum(axis=0)
+
+    return pd.DataFrame(
+        {
+            "count": observed,
+            "fraction": observed / observed.sum(),
+            "fraction_lower": frac_lower,
+            "fraction_upper": frac_upper,
+            "rate": observed / n_alerts,
+            "rate_lower": rate_lower,
+            "rate_upper": rate_upper,
+        },
+        index=pd.Index(table.columns, name=class_key),
+    )
@@ -12,9 +12,22 @@ plt.rc("text", usetex=True)
 plt.rc("text.latex", preamble=r"\usepackage{romanbar}")
 plt.rcParams["font.family"] = "sans-serif"
 
-output_folder = "/Users/robertstein/Work/papers/ztf_nu_paper/figures/"
-plot_dir = os.path.join(
-    os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "plots/"
+# Both output locations can be overridden, e.g. by `nuztfpaper build`
+output_folder_env_var = "NUZTFPAPER_OUTPUT_DIR"
+plot_dir_env_var = "NUZTFPAPER_PLOT_DIR"
+
+output_folder = os.environ.get(
+    output_folder_env_var,
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "paper_figures/"
+    ),
+)
+
+plot_dir = os.environ.get(
+    plot_dir_env_var,
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "plots/"
+    ),
 )
 
 data_dir = os.path.join(
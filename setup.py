@@ -15,6 +15,11 @@ setuptools.setup(
     keywords="astronomy astroparticle science",
     url="https://github.com/robertdstein/nuztfpaper",
     packages=setuptools.find_packages(),
+    entry_points={
+        "console_scripts": [
+            "nuztfpaper=nuztfpaper.cli:main",
+        ],
+    },
     classifiers=[
         "License :: OSI Approved :: MIT License",
         "Operating System :: OS Independent",
@@ -26,11 +31,14 @@ setuptools.setup(
         "matplotlib",
         "astropy",
         "jupyter",
+        "nbclient",
+        "nbformat",
         "seaborn",
         "nuztf>=2.4.1",
         "flarestack>=2.2.6",
         "openpyxl",
         "numpy",
         "pandas",
+        "pyarrow",
     ],
 )